@@ -7,6 +7,9 @@ PROJECT_ROOT = r"C:\Users\Abhishek Yadav\Documents\GMB Scraper"
 # --- DEDICATED PROFILE SETUP (IN A SAFE LOCATION) ---
 # We will ONLY use this path. Chrome will create 'Default' inside it automatically.
 CHROME_PROFILE_PATH = r"C:\Users\Abhishek Yadav\Documents\GMB Scraper\Chrome-Master-Profile" 
+# Stamped into the master profile by create_master_profile.py / refresh_profile.py.
+# The GMB scraper re-copies its worker profiles whenever this stamp changes.
+PROFILE_GENERATION_FILE = "gmb_profile_generation.txt"
 
 # --- Google Sheets Config ---
 SHEET_NAME = "GMB Scraper"
@@ -15,13 +18,19 @@ GCP_CREDENTIALS_PATH = os.path.join(PROJECT_ROOT, "gcp_credentials.json")
 
 # --- Scraping Config ---
 SEARCH_URL = "https://www.google.com"
+# Optional path to a chromedriver executable. If it exists, webdriver-manager is skipped entirely.
+CHROMEDRIVER_PATH = None
 KEYWORDS_PER_BATCH = 40
+# Run Chrome without a window for faster page loads. Set to False to watch the browser or solve CAPTCHAs by hand.
+HEADLESS_BROWSER = True
+# Type search keywords one character at a time like a person. When False the keyword is filled in instantly.
+HUMAN_TYPING = False
 
 # --- NEW: CAPTCHA HANDLING CONFIG ---
 # The total time (in seconds) the script will wait for a CAPTCHA to be solved manually.
 CAPTCHA_WAIT_TIMEOUT = 900  # 900 seconds = 15 minutes
 # The interval (in seconds) at which the script checks if the CAPTCHA is gone.
-CAPTCHA_CHECK_INTERVAL = 5  # 5 seconds
+CAPTCHA_CHECK_INTERVAL = 2  # 2 seconds
 
 # List of user agents to rotate for stealth
 USER_AGENTS = [
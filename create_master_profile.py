@@ -51,5 +51,9 @@ if __name__ == "__main__":
         driver.quit()
     except:
         pass
-        
+
+    # Stamp the new profile so the GMB scraper re-copies it for its parallel workers
+    with open(os.path.join(MASTER_PROFILE_PATH, config.PROFILE_GENERATION_FILE), 'w') as f:
+        f.write(str(time.time()))
+
     logging.info("Master profile has been created and primed. You can now run the main.py script.")
\ No newline at end of file
@@ -2,16 +2,25 @@
 # Scrapes Google My Business listings after clicking "More businesses".
 
 import time
+import csv
+import json
 import random
 import logging
 import os
-import pandas as pd
+import lxml.html
 import gspread
 import smtplib
 import traceback
 import re
+import queue
+import shutil
+import threading
+import atexit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 from email.mime.text import MIMEText
-from oauth2client.service_account import ServiceAccountCredentials
+from openpyxl import Workbook
+from google.oauth2.service_account import Credentials
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -19,7 +28,7 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
 from webdriver_manager.chrome import ChromeDriverManager
 
 # --- These imports use your existing config files without modification ---
@@ -32,23 +41,76 @@ import serp_selectors
 
 GMB_WORKSHEET_NAME = "GMB lists"
 OUTPUT_EXCEL_FILE = "GMB_Scraped_Data.xlsx"
+# Listings are appended here after every keyword, so a crash never loses finished work. The Excel file is built from it at the end.
+OUTPUT_CSV_FILE = "GMB_Scraped_Data.csv"
+GMB_COLUMNS = ["Keyword", "Name", "Rating", "Number of Reviews", "Category", "Years in Business", "Address", "Phone Number"]
+# CSV holds everything as text; these columns are converted back to numbers for Excel.
+NUMERIC_COLUMNS = {"Rating": float, "Number of Reviews": int}
 PROGRESS_TRACKING_FILE = "gmb_completed_keywords.txt"
+# Local copy of the sheet's keywords, so resumed runs don't have to hit the Sheets API every time.
+KEYWORDS_CACHE_FILE = "keywords_cache.json"
+KEYWORDS_CACHE_TTL_SECONDS = 24 * 60 * 60 # Delete the cache file to pick up sheet changes sooner
+# Written inside the Chrome profile once the cookie banner has been dealt with, so later runs skip the probe.
+COOKIE_CONSENT_SENTINEL_FILE = "gmb_cookies_handled"
+# Cookies Google sets once consent has been given.
+CONSENT_COOKIE_NAMES = ["SOCS", "CONSENT"]
 MAX_GMB_PAGES_TO_SCRAPE = 10
+# Number of Chrome instances scraping keywords in parallel. Keep this low to avoid Google rate-limiting.
+MAX_CONCURRENT_WORKERS = 5
+# Seconds between the start of each worker, so the first searches aren't fired in lockstep.
+WORKER_STAGGER_SECONDS = 0.1
+# Lock files and caches that are not copied from the master profile into the worker profiles.
+WORKER_PROFILE_IGNORE = shutil.ignore_patterns('Singleton*', 'lockfile', 'Cache', 'Code Cache', 'GPUCache')
+
+# Third-party requests the scraper never needs; blocked via CDP to speed up page loads.
+BLOCKED_URL_PATTERNS = ["*doubleclick*", "*googlesyndication*", "*google-analytics*", "*gstatic.com/images/*"]
 
 # --- CSS/XPATH SELECTORS for GMB Scraping ---
-# Using a more robust XPath selector that finds the link by its visible text.
+# The "More businesses" footer link points at the local results (tbm=lcl); the CSS selector is the fast path.
+# The XPath that finds the link by its visible text is kept as a fallback in case Google changes the markup.
+MORE_BUSINESSES_BUTTON_CSS = "a.fl[href*='tbm=lcl']"
 MORE_BUSINESSES_BUTTON_XPATH = "//a[contains(., 'More businesses')]"
 GMB_LISTING_CONTAINER = "div.rllt__details"
+COOKIE_CONSENT_BUTTON_XPATH = "//button[contains(., 'Accept all') or contains(., 'Reject all') or contains(., 'I agree')]"
+# The XPath returns buttons in document order (Google puts "Reject all" first); this is the order we prefer to click them in.
+COOKIE_CONSENT_BUTTON_TEXTS = ["Accept all", "Reject all", "I agree"]
 GMB_NEXT_PAGE_BUTTON = '#pnnext'
 
+# --- Precompiled patterns for parsing listing text ---
+_RATING_RE = re.compile(r'(\d\.\d)')
+_REVIEWS_RE = re.compile(r'\((\d{1,3}(?:,\d{3})*|\d+)\)')
+_YEARS_RE = re.compile(r'(\d+\+?)\+?\s+years in business', re.IGNORECASE)
+_PHONE_RE = re.compile(r'(\d{5}\s\d{5}|\d{10}|[0-9\s]{8,})')
+_WS_RE = re.compile(r'\s+')
+
+# Page readiness is detected with explicit waits; the only fixed delay left is the anti-bot pause between keywords.
 DELAY_CONFIG = {
-    "after_page_load": {"min": 2.5, "max": 4.0},
-    "gmb_list_read": {"min": 3.0, "max": 5.0},
-    "before_next_page": {"min": 2.0, "max": 3.5},
-    "between_keywords": {"min": 10.0, "max": 25.0},
-    "scroll_pause": {"min": 0.8, "max": 1.5}
+    "between_keywords": {"min": 10.0, "max": 25.0}
 }
 
+# Scrolls to the bottom up to 5 times inside the browser, stopping once the page stops growing for 3s.
+# Runs as one async script so the whole loop costs a single WebDriver round-trip.
+SCROLL_PAGE_JS = """
+const done = arguments[arguments.length - 1];
+let rounds = 0;
+const scrollOnce = () => {
+    const lastHeight = document.body.scrollHeight;
+    window.scrollTo(0, lastHeight);
+    const started = Date.now();
+    const poll = setInterval(() => {
+        const newHeight = document.body.scrollHeight;
+        if (newHeight !== lastHeight) {
+            clearInterval(poll);
+            if (++rounds >= 5) done(newHeight); else scrollOnce();
+        } else if (Date.now() - started >= 3000) {
+            clearInterval(poll);
+            done(newHeight);
+        }
+    }, 100);
+};
+scrollOnce();
+"""
+
 # ==============================================================================
 # --- LOGGING, EMAIL, AND PROGRESS TRACKING ---
 # ==============================================================================
@@ -71,6 +133,39 @@ def send_error_email(subject, body):
     except Exception as e:
         logging.error(f"CRITICAL: FAILED TO SEND ERROR EMAIL. Error: {e}")
 
+# Guard the progress and output files, which every worker appends to.
+_progress_lock = threading.Lock()
+_output_lock = threading.Lock()
+
+def append_listings_to_csv(rows):
+    output_csv_path = os.path.join(config.PROJECT_ROOT, OUTPUT_CSV_FILE)
+    with _output_lock:
+        write_header = not os.path.exists(output_csv_path)
+        with open(output_csv_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=GMB_COLUMNS)
+            if write_header: writer.writeheader()
+            writer.writerows(rows)
+    logging.info(f"Appended {len(rows)} listings to {OUTPUT_CSV_FILE}.")
+
+def build_excel_from_csv():
+    output_csv_path = os.path.join(config.PROJECT_ROOT, OUTPUT_CSV_FILE)
+    output_path = os.path.join(config.PROJECT_ROOT, OUTPUT_EXCEL_FILE)
+    if not os.path.exists(output_csv_path):
+        logging.warning(f"No {OUTPUT_CSV_FILE} found, so there is nothing to save to Excel.")
+        return
+    logging.info(f"Building {output_path} from {output_csv_path}...")
+    # Write-only mode streams rows straight to disk, so memory stays flat however big the CSV gets
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("GMB")
+    ws.append(GMB_COLUMNS)
+    row_count = 0
+    with open(output_csv_path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            ws.append([NUMERIC_COLUMNS[col](row[col]) if row[col] and col in NUMERIC_COLUMNS else (row[col] or None) for col in GMB_COLUMNS])
+            row_count += 1
+    wb.save(output_path)
+    logging.info(f"Successfully saved {row_count} listings to Excel.")
+
 def load_completed_keywords():
     completed = set()
     progress_file_path = os.path.join(config.PROJECT_ROOT, PROGRESS_TRACKING_FILE)
@@ -80,102 +175,250 @@ def load_completed_keywords():
     logging.info(f"Loaded {len(completed)} completed keywords from progress file.")
     return completed
 
-def save_completed_keyword(keyword):
+# Kept open (line-buffered) for the whole run instead of reopening the file for every keyword.
+_progress_fh = None
+
+def open_progress_file():
+    global _progress_fh
     progress_file_path = os.path.join(config.PROJECT_ROOT, PROGRESS_TRACKING_FILE)
-    with open(progress_file_path, 'a') as f:
-        f.write(keyword + '\n')
+    _progress_fh = open(progress_file_path, 'a', buffering=1)
+
+def close_progress_file():
+    global _progress_fh
+    if _progress_fh:
+        _progress_fh.close()
+        _progress_fh = None
+
+def save_completed_keyword(keyword):
+    with _progress_lock:
+        _progress_fh.write(keyword + '\n')
     logging.info(f"Saved '{keyword}' to progress file.")
 
 # ==============================================================================
 # --- NEW: CAPTCHA AND COOKIE HANDLING FUNCTIONS ---
 # ==============================================================================
 
+# Set when the run has to stop early (e.g. a CAPTCHA in headless mode). Workers stop taking new keywords.
+_stop_event = threading.Event()
+_stop_lock = threading.Lock()
+
+def stop_run(subject, body):
+    """Stops every worker from taking new keywords and alerts the operator, once per run."""
+    with _stop_lock:
+        if _stop_event.is_set(): return
+        _stop_event.set()
+    logging.error(f"Stopping the run: {subject}")
+    send_error_email(subject, body)
+
+# Profiles whose cookie banner has been handled; the consent cookie then lives in that profile.
+_cookies_handled_profiles = set()
+
 def handle_captcha(driver, keyword):
-    alert_sent = False
-    start_time = time.time()
     logging.warning("!!! CAPTCHA DETECTED !!! Pausing script and waiting for manual intervention.")
-    
-    while time.time() - start_time < config.CAPTCHA_WAIT_TIMEOUT:
-        if not driver.find_elements(By.CSS_SELECTOR, 'iframe[title="reCAPTCHA"]'):
-            logging.info("CAPTCHA solved! Resuming script.")
-            return True
-
-        if not alert_sent:
-            print("\n" + "="*60)
-            print(f"ACTION REQUIRED: Please solve the CAPTCHA in the browser.")
-            print(f"The script will wait for up to {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minutes.")
-            print("="*60 + "\n")
-            
-            email_subject = "GMB Scraper Alert: CAPTCHA - Action Required"
-            email_body = f"Hello,\n\nThe GMB Scraper has encountered a Google CAPTCHA and is paused.\n\nKeyword: \"{keyword}\"\n\nPlease solve it in the browser. The script will resume automatically."
-            send_error_email(email_subject, email_body)
-            alert_sent = True
-        
-        time.sleep(config.CAPTCHA_CHECK_INTERVAL)
-        print(".", end="", flush=True)
-
-    logging.error(f"CAPTCHA Timeout! Aborting keyword '{keyword}'.")
-    return False
-
-def handle_cookie_consent(driver):
-    """Looks for common cookie consent buttons and clicks one if found."""
-    time.sleep(2) # Wait for banner to appear
+    print("\n" + "="*60)
+    print(f"ACTION REQUIRED: Please solve the CAPTCHA in the browser.")
+    print(f"The script will wait for up to {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minutes.")
+    print("="*60 + "\n")
+
+    # Send the alert in the background so it doesn't delay the wait; skipped if the CAPTCHA is gone within 5s
+    email_subject = "GMB Scraper Alert: CAPTCHA - Action Required"
+    email_body = f"Hello,\n\nThe GMB Scraper has encountered a Google CAPTCHA and is paused.\n\nKeyword: \"{keyword}\"\n\nPlease solve it in the browser. The script will resume automatically."
+    alert_timer = threading.Timer(5.0, send_error_email, args=(email_subject, email_body))
+    alert_timer.start()
     try:
-        # Tries to find buttons by their text content using XPath
-        consent_buttons = [
-            "//button[contains(., 'Accept all')]",
-            "//button[contains(., 'Reject all')]",
-            "//button[contains(., 'I agree')]"
-        ]
-        for xpath in consent_buttons:
-            try:
-                button = driver.find_element(By.XPATH, xpath)
-                logging.info(f"Found a cookie consent button with text: '{button.text}'. Clicking it.")
-                button.click()
-                time.sleep(2) # Wait for banner to disappear
-                return # Exit after clicking one
-            except NoSuchElementException:
-                continue # Try next button
+        WebDriverWait(driver, config.CAPTCHA_WAIT_TIMEOUT, poll_frequency=config.CAPTCHA_CHECK_INTERVAL).until_not(
+            EC.presence_of_element_located((By.CSS_SELECTOR, 'iframe[title="reCAPTCHA"]')))
+        logging.info("CAPTCHA solved! Resuming script.")
+        return True
+    except TimeoutException:
+        logging.error(f"CAPTCHA Timeout! Aborting keyword '{keyword}'.")
+        return False
+    finally:
+        alert_timer.cancel()
+
+def pick_consent_button(buttons):
+    """Returns the clickable consent button to press, preferring 'Accept all' as the per-button XPaths used to."""
+    buttons = [(button, button.text) for button in buttons if button.is_displayed() and button.is_enabled()]
+    for wanted_text in COOKIE_CONSENT_BUTTON_TEXTS:
+        for button, text in buttons:
+            if wanted_text in text: return button
+    return False # Keeps WebDriverWait polling
+
+def handle_cookie_consent(driver, profile_path):
+    """Looks for common cookie consent buttons and clicks one if found. Skipped once the given profile has consented."""
+    sentinel_path = os.path.join(profile_path, COOKIE_CONSENT_SENTINEL_FILE)
+    if profile_path in _cookies_handled_profiles: return
+    if os.path.exists(sentinel_path):
+        _cookies_handled_profiles.add(profile_path)
+        return
+    try:
+        try:
+            # Wait briefly for any of the banner buttons; one XPath means one DOM query per poll
+            button = WebDriverWait(driver, 3, ignored_exceptions=[StaleElementReferenceException]).until(lambda d: pick_consent_button(d.find_elements(By.XPATH, COOKIE_CONSENT_BUTTON_XPATH)))
+        except TimeoutException:
+            # No banner showed up. Only trust that if the profile really holds the consent cookie; a slow page load looks the same
+            if not any(driver.get_cookie(name) for name in CONSENT_COOKIE_NAMES): return
+        else:
+            logging.info(f"Found a cookie consent button with text: '{button.text}'. Clicking it.")
+            button.click()
+            try: WebDriverWait(driver, 3).until(EC.staleness_of(button)) # Wait for banner to disappear
+            except TimeoutException: pass
     except Exception as e:
         logging.warning(f"Could not handle cookie consent banner: {e}")
+        return
+    _cookies_handled_profiles.add(profile_path)
+    try:
+        with open(sentinel_path, 'w') as f:
+            f.write(time.strftime('%Y-%m-%d %H:%M:%S'))
+    except OSError as e:
+        logging.warning(f"Could not write cookie consent sentinel file: {e}")
 
 # ==============================================================================
 # --- SELENIUM & HELPER FUNCTIONS ---
 # ==============================================================================
 
-def get_humanlike_driver():
+def get_worker_profile_path(worker_idx):
+    """Chrome locks its user-data-dir, so every worker after the first runs on its own copy of the master profile."""
+    if worker_idx == 0: return config.CHROME_PROFILE_PATH
+    return f"{config.CHROME_PROFILE_PATH}-Worker-{worker_idx}"
+
+def read_profile_generation(profile_path):
+    """Returns the generation stamp written by create_master_profile.py / refresh_profile.py, or None if there is none."""
+    try:
+        with open(os.path.join(profile_path, config.PROFILE_GENERATION_FILE), 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def prepare_worker_profile(worker_idx):
+    """Brings a worker's profile copy up to date with the master. Only call this before the worker's Chrome starts."""
+    profile_path = get_worker_profile_path(worker_idx)
+    if worker_idx == 0 or not os.path.exists(config.CHROME_PROFILE_PATH): return profile_path
+    # The stamp travels with the copy, so a different stamp means the master has been rebuilt since
+    if os.path.exists(profile_path) and read_profile_generation(profile_path) == read_profile_generation(config.CHROME_PROFILE_PATH):
+        return profile_path
+    try:
+        if os.path.exists(profile_path):
+            logging.info(f"Master profile has changed. Removing stale copy for worker {worker_idx}: {profile_path}")
+            shutil.rmtree(profile_path)
+        logging.info(f"Copying master profile for worker {worker_idx} to: {profile_path}")
+        shutil.copytree(config.CHROME_PROFILE_PATH, profile_path, ignore=WORKER_PROFILE_IGNORE)
+    except OSError as e:
+        logging.warning(f"Could not refresh the profile copy for worker {worker_idx}: {e}")
+    return profile_path
+
+# Resolved once per run and shared by every driver in the pool.
+_chromedriver_path = None
+_chromedriver_lock = threading.Lock()
+
+def get_chromedriver_path():
+    global _chromedriver_path
+    with _chromedriver_lock:
+        if _chromedriver_path is None:
+            if config.CHROMEDRIVER_PATH and os.path.exists(config.CHROMEDRIVER_PATH):
+                _chromedriver_path = config.CHROMEDRIVER_PATH
+            else:
+                _chromedriver_path = ChromeDriverManager().install()
+            logging.info(f"Using ChromeDriver at: {_chromedriver_path}")
+        return _chromedriver_path
+
+def get_humanlike_driver(profile_path=None):
     logging.info("Initializing human-like Chrome WebDriver...")
     options = Options()
     options.add_argument(f'user-agent={random.choice(config.USER_AGENTS)}')
-    options.add_argument(f"--user-data-dir={config.CHROME_PROFILE_PATH}")
+    options.add_argument(f"--user-data-dir={profile_path or config.CHROME_PROFILE_PATH}")
     options.add_argument("--no-first-run"); options.add_argument("--disable-infobars")
     options.add_argument("--disable-extensions"); options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
-    service = Service(ChromeDriverManager().install())
+    # Only listing text is scraped, so skip images and notifications entirely
+    if config.HEADLESS_BROWSER: options.add_argument("--headless=new")
+    options.add_argument("--blink-settings=imagesEnabled=false"); options.add_argument("--disable-gpu")
+    options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2, "profile.default_content_setting_values.notifications": 2})
+    service = Service(get_chromedriver_path())
     driver = webdriver.Chrome(service=service, options=options)
     driver.set_page_load_timeout(60)
+    driver.set_script_timeout(30) # Covers the in-browser scroll loop in SCROLL_PAGE_JS
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    except Exception as e:
+        logging.warning(f"Could not set up request blocking: {e}")
     return driver
 
+def reset_or_replace_driver(worker_idx, driver):
+    """Clears per-site storage so the next keyword starts clean, or swaps in a fresh driver if this one has died."""
+    if driver is None: return None
+    try:
+        # Cookies are kept on purpose: they hold the profile's sign-in and cookie consent
+        driver.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}")
+        return driver
+    except Exception as e: # A dead chromedriver surfaces as urllib3/connection errors, not just WebDriverException
+        logging.warning(f"WebDriver for worker {worker_idx} stopped responding ({e}). Replacing it.")
+        try: driver.quit()
+        except Exception: pass
+        try:
+            return get_humanlike_driver(get_worker_profile_path(worker_idx))
+        except Exception as e:
+            logging.error(f"Could not start a replacement WebDriver for worker {worker_idx}: {e}")
+            return None # Retried at the start of this worker's next keyword
+
+def close_driver_pool(driver_pool):
+    while not driver_pool.empty():
+        worker_idx, driver = driver_pool.get()
+        if driver is None: continue
+        logging.info(f"Closing WebDriver for worker {worker_idx}.")
+        try: driver.quit()
+        except Exception as e: logging.warning(f"Could not close WebDriver for worker {worker_idx}: {e}")
+
 def connect_to_google_sheets():
     logging.info("Connecting to Google Sheets API...")
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-    creds = ServiceAccountCredentials.from_json_keyfile_name(config.GCP_CREDENTIALS_PATH, scope)
+    scope = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+    creds = Credentials.from_service_account_file(config.GCP_CREDENTIALS_PATH, scopes=scope)
     client = gspread.authorize(creds); logging.info("Successfully connected to Google Sheets API.")
     return client
 
 def get_keywords_from_sheet(worksheet):
     logging.info(f"Fetching keywords from worksheet: '{worksheet.title}'")
-    keywords = [kw.strip() for kw in worksheet.col_values(1)[1:] if kw.strip()]
+    # A ranged get() skips the header row server-side and can later be extended to more columns in the same call
+    rows = worksheet.get('A2:A', value_render_option='UNFORMATTED_VALUE')
+    keywords = [str(row[0]).strip() for row in rows if row and str(row[0]).strip()]
     logging.info(f"Successfully fetched {len(keywords)} keywords.")
     return keywords
 
+def load_keywords():
+    """Returns the keyword list from the local cache while it is fresh, otherwise from the Google Sheet."""
+    cache_path = os.path.join(config.PROJECT_ROOT, KEYWORDS_CACHE_FILE)
+    if os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < KEYWORDS_CACHE_TTL_SECONDS:
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            # Only reuse the cache if it was fetched from the sheet we are configured for now
+            if cache.get("sheet") == config.SHEET_NAME and cache.get("worksheet") == GMB_WORKSHEET_NAME:
+                logging.info(f"Loaded {len(cache['keywords'])} keywords from cache: {cache_path}")
+                return cache["keywords"]
+            logging.info("Keyword cache belongs to a different sheet. Fetching from Google Sheets instead.")
+        except (json.JSONDecodeError, KeyError, AttributeError) as e:
+            logging.warning(f"Keyword cache is unreadable ({e}). Fetching from Google Sheets instead.")
+    gspread_client = connect_to_google_sheets()
+    worksheet = gspread_client.open(config.SHEET_NAME).worksheet(GMB_WORKSHEET_NAME)
+    keywords = get_keywords_from_sheet(worksheet)
+    # Write to a temp file and swap it in, so an interrupted run never leaves a truncated cache behind
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"sheet": config.SHEET_NAME, "worksheet": GMB_WORKSHEET_NAME, "keywords": keywords}, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+    return keywords
+
 def find_and_type_in_search_box(driver, text):
     try:
         search_box = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, "[name='q']")))
         search_box.clear()
-        for char in text:
-            search_box.send_keys(char)
-            time.sleep(random.uniform(0.05, 0.15))
+        if config.HUMAN_TYPING:
+            for char in text:
+                search_box.send_keys(char)
+                time.sleep(random.uniform(0.05, 0.15))
+        else:
+            driver.execute_script("arguments[0].value = arguments[1]; arguments[0].dispatchEvent(new Event('input', {bubbles: true}));", search_box, text)
         search_box.send_keys(Keys.RETURN)
         return True
     except TimeoutException:
@@ -185,124 +428,200 @@ def find_and_type_in_search_box(driver, text):
 def scroll_page_down(driver):
     logging.info("Scrolling page to load all results...")
     try:
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        for _ in range(5):
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(random.uniform(DELAY_CONFIG["scroll_pause"]["min"], DELAY_CONFIG["scroll_pause"]["max"]))
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height: break
-            last_height = new_height
+        driver.execute_async_script(SCROLL_PAGE_JS)
         logging.info("Finished scrolling.")
     except Exception as e:
         logging.warning(f"Could not scroll the page: {e}")
 
 # ==============================================================================
-# --- CORE GMB PARSING FUNCTION (No changes needed here) ---
+# --- CORE GMB PARSING FUNCTIONS ---
 # ==============================================================================
+def element_text(element):
+    """Visible-style text of an lxml element: text nodes joined by single spaces, like Selenium's .text."""
+    return " ".join(part.strip() for part in element.itertext() if part.strip())
+
 def parse_gmb_listing(element, keyword):
-    data = {"Keyword": keyword, "Name": None, "Rating": None, "Number of Reviews": None, "Category": None, "Years in Business": None, "Address": None, "Phone Number": None}
-    try: data["Name"] = element.find_element(By.CSS_SELECTOR, "div.dbg0pd span").text
-    except: pass
-    try:
-        rating_line = element.find_element(By.CSS_SELECTOR, "span.Y0A0hc").text
+    """Parses one listing container (an lxml element from the page source) into a row of GMB data."""
+    data = dict.fromkeys(GMB_COLUMNS)
+    data["Keyword"] = keyword
+    if name_spans := element.cssselect("div.dbg0pd span"): data["Name"] = element_text(name_spans[0]) or None
+    if (rating_spans := element.cssselect("span.Y0A0hc")) and (rating_line := element_text(rating_spans[0])):
         parts = rating_line.split('·')
-        if r_match := re.search(r'(\d\.\d)', parts[0]): data["Rating"] = float(r_match.group(1))
-        if rev_match := re.search(r'\((\d{1,3}(,\d{3})*|\d+)\)', parts[0]): data["Number of Reviews"] = int(rev_match.group(1).replace(',', ''))
+        if r_match := _RATING_RE.search(parts[0]): data["Rating"] = float(r_match.group(1))
+        if rev_match := _REVIEWS_RE.search(parts[0]): data["Number of Reviews"] = int(rev_match.group(1).replace(',', ''))
         if len(parts) > 1: data["Category"] = parts[1].strip()
-    except: pass
-    try:
-        details_divs = element.find_elements(By.XPATH, "./div")
-        full_text = " ".join([div.text for div in details_divs if div.text])
-        if y_match := re.search(r'(\d+\+?)\+?\s+years in business', full_text, re.IGNORECASE): data["Years in Business"] = y_match.group(1)
-        if p_match := re.search(r'(\d{5}\s\d{5}|\d{10}|[0-9\s]{8,})', full_text):
-            phone = re.sub(r'\s+', '', p_match.group(0)).strip()
-            if len(phone) >= 8: data["Phone Number"] = p_match.group(0).strip()
-        for div in details_divs:
-            text = div.text.strip()
-            if not text or "years in business" in text.lower() or (data["Phone Number"] and data["Phone Number"] in text) or "·" in text or "Open" in text or "Closes" in text or "On-site services" in text: continue
-            if len(text) > 15:
-                data["Address"] = text
-                break
-    except: pass
+    # Each div's text is extracted once and reused for both the full-text regexes and the address scan
+    details_texts = [text for div in element.xpath("./div") if (text := element_text(div))]
+    full_text = " ".join(details_texts)
+    if y_match := _YEARS_RE.search(full_text): data["Years in Business"] = y_match.group(1)
+    if p_match := _PHONE_RE.search(full_text):
+        phone = _WS_RE.sub('', p_match.group(0)).strip()
+        if len(phone) >= 8: data["Phone Number"] = p_match.group(0).strip()
+    for text in details_texts:
+        if "years in business" in text.lower() or (data["Phone Number"] and data["Phone Number"] in text) or "·" in text or "Open" in text or "Closes" in text or "On-site services" in text: continue
+        if len(text) > 15:
+            data["Address"] = text
+            break
     return data
 
+def parse_gmb_page(driver, keyword):
+    """Fetches the page source once and parses every listing in-process with lxml."""
+    tree = lxml.html.fromstring(driver.page_source)
+    return [parse_gmb_listing(element, keyword) for element in tree.cssselect(GMB_LISTING_CONTAINER)]
+
 # ==============================================================================
-# --- MAIN EXECUTION BLOCK (Updated Logic) ---
+# --- PER-KEYWORD WORKER ---
 # ==============================================================================
-if __name__ == "__main__":
-    logging.info(f"--- Starting GMB Scraper Script for worksheet '{GMB_WORKSHEET_NAME}' ---")
-    driver = None
-    all_gmb_data = []
+def scrape_keyword(driver_pool, keyword, start_delay=0.0):
+    """Borrows a driver from the pool, scrapes every GMB page for one keyword and returns the parsed listings."""
+    if _stop_event.wait(start_delay): return [] # Left unmarked, so the next run picks it up
+    worker_idx, driver = driver_pool.get()
+    gmb_data = []
     try:
-        completed_keywords = load_completed_keywords()
-        gspread_client = connect_to_google_sheets()
-        worksheet = gspread_client.open(config.SHEET_NAME).worksheet(GMB_WORKSHEET_NAME)
-        keywords_to_scrape = get_keywords_from_sheet(worksheet)
-        driver = get_humanlike_driver()
-        
-        for i, keyword in enumerate(keywords_to_scrape):
-            if keyword in completed_keywords:
-                logging.info(f"Skipping already completed keyword: '{keyword}'")
-                continue
-
-            logging.info(f"\n--- Processing keyword {i+1}/{len(keywords_to_scrape)}: '{keyword}' ---")
+        if _stop_event.is_set(): return gmb_data # The run was stopped while this keyword waited for a driver
+        if driver is None: driver = get_humanlike_driver(get_worker_profile_path(worker_idx))
+        logging.info(f"\n--- [Worker {worker_idx}] Processing keyword: '{keyword}' ---")
+        # The previous keyword's results page still has a search box, so only load the homepage when we're elsewhere
+        # (checked on the parsed path: the CAPTCHA page's URL contains "google.com/search" in its continue= parameter)
+        if urlparse(driver.current_url).path != "/search":
             driver.get(config.SEARCH_URL)
-            handle_cookie_consent(driver) # Handle cookies first
-            time.sleep(random.uniform(DELAY_CONFIG["after_page_load"]["min"], DELAY_CONFIG["after_page_load"]["max"]))
-            
-            if not find_and_type_in_search_box(driver, keyword): continue
-            
-            # --- NEW: Check for CAPTCHA right after search ---
-            if driver.find_elements(By.CSS_SELECTOR, 'iframe[title="reCAPTCHA"]'):
-                if not handle_captcha(driver, keyword):
-                    save_completed_keyword(keyword) # Mark as failed/skipped
-                    continue # Move to next keyword
-            
+            handle_cookie_consent(driver, get_worker_profile_path(worker_idx)) # Handle cookies first
+
+        old_page = driver.find_element(By.TAG_NAME, "html")
+        if not find_and_type_in_search_box(driver, keyword): return gmb_data
+        try:
+            WebDriverWait(driver, 15).until(EC.staleness_of(old_page))
+        except TimeoutException:
+            logging.warning(f"Search results did not load for '{keyword}'. It will be retried on the next run.")
+            return gmb_data
+
+        # --- NEW: Check for CAPTCHA right after search ---
+        if driver.find_elements(By.CSS_SELECTOR, 'iframe[title="reCAPTCHA"]'):
+            if config.HEADLESS_BROWSER:
+                # Nobody can solve it without a visible browser, and Google is now blocking us, so stop the whole run
+                stop_run("GMB Scraper Alert: CAPTCHA - Run Stopped",
+                         f"Hello,\n\nThe GMB Scraper hit a Google CAPTCHA while running headless, so it cannot be solved by hand.\n\nKeyword: \"{keyword}\"\n\nThe run has stopped taking new keywords. Remaining keywords will be retried on the next run. Set HEADLESS_BROWSER = False in config.py to solve CAPTCHAs manually.")
+                return gmb_data
+            if not handle_captcha(driver, keyword):
+                save_completed_keyword(keyword) # Mark as failed/skipped
+                return gmb_data # Move to next keyword
+
+        if "tbm=lcl" in driver.current_url:
+            logging.info("Search stayed on the local results page. No need for 'More businesses'.")
+        else:
             try:
                 logging.info("Looking for 'More businesses' button...")
-                more_button = WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.XPATH, MORE_BUSINESSES_BUTTON_XPATH)))
+                more_button = WebDriverWait(driver, 20).until(EC.any_of(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, MORE_BUSINESSES_BUTTON_CSS)),
+                    EC.element_to_be_clickable((By.XPATH, MORE_BUSINESSES_BUTTON_XPATH))))
                 driver.execute_script("arguments[0].click();", more_button)
                 logging.info("Clicked 'More businesses'.")
+                WebDriverWait(driver, 15).until(EC.staleness_of(more_button)) # Don't mistake the SERP's local pack for page 1
             except TimeoutException:
-                logging.warning(f"Could not find 'More businesses' button for '{keyword}'. Skipping.")
+                logging.warning(f"Could not open 'More businesses' for '{keyword}'. Skipping.")
                 save_completed_keyword(keyword)
-                continue
-
-            for page_num in range(1, MAX_GMB_PAGES_TO_SCRAPE + 1):
-                logging.info(f"--- Scraping GMB Page {page_num} for '{keyword}' ---")
-                time.sleep(random.uniform(DELAY_CONFIG["gmb_list_read"]["min"], DELAY_CONFIG["gmb_list_read"]["max"]))
-                scroll_page_down(driver)
-                listings = driver.find_elements(By.CSS_SELECTOR, GMB_LISTING_CONTAINER)
-                logging.info(f"Found {len(listings)} listings on this page.")
-                if not listings: break
-                for listing_element in listings:
-                    if parsed_data := parse_gmb_listing(listing_element, keyword):
-                        if parsed_data.get("Name"): all_gmb_data.append(parsed_data)
+                return gmb_data
+
+        for page_num in range(1, MAX_GMB_PAGES_TO_SCRAPE + 1):
+            logging.info(f"--- Scraping GMB Page {page_num} for '{keyword}' ---")
+            try:
+                listings = WebDriverWait(driver, 8).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, GMB_LISTING_CONTAINER)))
+            except TimeoutException:
+                logging.info("No listings appeared on this page.")
+                break
+            scroll_page_down(driver)
+            page_data = parse_gmb_page(driver, keyword)
+            logging.info(f"Found {len(page_data)} listings on this page.")
+            if not page_data: break
+            gmb_data.extend(parsed_data for parsed_data in page_data if parsed_data.get("Name"))
+            try:
+                next_button = WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.CSS_SELECTOR, GMB_NEXT_PAGE_BUTTON)))
+            except TimeoutException:
+                logging.info("No 'Next' button found. End of results.")
+                break
+            driver.execute_script("arguments[0].click();", next_button)
+            try:
+                # The old listings are replaced once the next page has loaded
+                WebDriverWait(driver, 15).until(EC.staleness_of(listings[0]))
+            except TimeoutException:
+                logging.warning(f"Next page did not load for '{keyword}'. Stopping here.")
+                break
+
+        if gmb_data: append_listings_to_csv(gmb_data)
+        save_completed_keyword(keyword)
+        logging.info(f"Finished scraping for '{keyword}'.")
+        return gmb_data
+    finally:
+        # Every exit path pauses, so a worker that keeps failing early doesn't fire searches back-to-back
+        if not _stop_event.is_set():
+            logging.info(f"[Worker {worker_idx}] Taking a break before the next keyword...")
+            _stop_event.wait(random.uniform(DELAY_CONFIG["between_keywords"]["min"], DELAY_CONFIG["between_keywords"]["max"]))
+        # The slot must always go back into the pool, or a later keyword blocks forever on driver_pool.get()
+        try:
+            driver = reset_or_replace_driver(worker_idx, driver)
+        except Exception as e:
+            logging.error(f"Could not reset WebDriver for worker {worker_idx}: {e}")
+            driver = None # Retried at the start of this worker's next keyword
+        finally:
+            driver_pool.put((worker_idx, driver))
+
+# ==============================================================================
+# --- MAIN EXECUTION BLOCK (Updated Logic) ---
+# ==============================================================================
+if __name__ == "__main__":
+    logging.info(f"--- Starting GMB Scraper Script for worksheet '{GMB_WORKSHEET_NAME}' ---")
+    driver_pool = queue.Queue()
+    atexit.register(close_driver_pool, driver_pool) # Make sure no Chrome processes outlive the script
+    new_listings = 0
+    try:
+        completed_keywords = load_completed_keywords()
+        open_progress_file()
+        keywords_to_scrape = load_keywords()
+        total_keywords = len(keywords_to_scrape)
+        keywords_to_scrape = [kw for kw in keywords_to_scrape if kw not in completed_keywords]
+        logging.info(f"Skipping {total_keywords - len(keywords_to_scrape)} already completed keywords; {len(keywords_to_scrape)} remain.")
+
+        if keywords_to_scrape:
+            num_workers = min(MAX_CONCURRENT_WORKERS, len(keywords_to_scrape))
+            # Copy every profile before any Chrome opens the master, so the copies are consistent
+            profile_paths = [prepare_worker_profile(worker_idx) for worker_idx in range(num_workers)]
+            for worker_idx, profile_path in enumerate(profile_paths):
+                driver_pool.put((worker_idx, get_humanlike_driver(profile_path)))
+
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
                 try:
-                    next_button = driver.find_element(By.CSS_SELECTOR, GMB_NEXT_PAGE_BUTTON)
-                    driver.execute_script("arguments[0].click();", next_button)
-                    time.sleep(random.uniform(DELAY_CONFIG["before_next_page"]["min"], DELAY_CONFIG["before_next_page"]["max"]))
-                except NoSuchElementException:
-                    logging.info("No 'Next' button found. End of results.")
-                    break
-            
-            save_completed_keyword(keyword)
-            logging.info(f"Finished scraping for '{keyword}'. Taking a break...")
-            time.sleep(random.uniform(DELAY_CONFIG["between_keywords"]["min"], DELAY_CONFIG["between_keywords"]["max"]))
-
-        if all_gmb_data:
-            output_path = os.path.join(config.PROJECT_ROOT, OUTPUT_EXCEL_FILE)
-            logging.info(f"Scraping complete. Saving {len(all_gmb_data)} listings to {output_path}...")
-            pd.DataFrame(all_gmb_data).to_excel(output_path, index=False)
-            logging.info("Successfully saved data to Excel.")
+                    futures = {}
+                    for idx, keyword in enumerate(keywords_to_scrape):
+                        start_delay = WORKER_STAGGER_SECONDS * idx if idx < num_workers else 0.0
+                        futures[executor.submit(scrape_keyword, driver_pool, keyword, start_delay)] = keyword
+
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        keyword = futures[future]
+                        try:
+                            new_listings += len(future.result())
+                        except Exception as e:
+                            logging.error(f"Error while scraping '{keyword}': {e}\n{traceback.format_exc()}")
+                        logging.info(f"Progress: {done}/{len(futures)} keywords processed.")
+                        if _stop_event.is_set():
+                            # Drop the queued keywords; only the ones already in progress finish
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            logging.error("Run stopped early. Unfinished keywords will be retried on the next run.")
+                            break
+                except BaseException:
+                    # On Ctrl-C (or a crash) drop the queued keywords instead of letting shutdown(wait=True) run them all
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+
+        if new_listings:
+            logging.info(f"Scraping complete. Collected {new_listings} new listings.")
         else:
             logging.warning("Scraping finished, but no new data was collected.")
+        build_excel_from_csv()
     except Exception as e:
         error_traceback = traceback.format_exc()
         logging.critical(f"A critical, unhandled error occurred: {e}\n{error_traceback}")
         send_error_email("GMB Scraper Alert: SCRIPT CRASHED", f"The GMB Scraper script has crashed.\n\nError:\n{e}\n\nTraceback:\n{error_traceback}")
     finally:
-        if driver:
-            logging.info("Closing WebDriver.")
-            driver.quit()
+        close_driver_pool(driver_pool)
+        close_progress_file()
         logging.info("--- GMB Scraper Script Finished ---")
\ No newline at end of file
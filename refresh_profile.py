@@ -6,6 +6,7 @@ import time
 import logging
 import os
 import shutil
+import glob
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
@@ -33,6 +34,14 @@ if __name__ == "__main__":
             logging.error("Please close all Chrome windows and run this script again.")
             exit() # Stop the script if we can't delete the folder
 
+    # The GMB scraper's parallel workers run on copies of the master profile; remove them so they are re-copied from the fresh one
+    for worker_profile_path in glob.glob(f"{MASTER_PROFILE_PATH}-Worker-*"):
+        logging.info(f"Removing worker profile copy at: {worker_profile_path}")
+        try:
+            shutil.rmtree(worker_profile_path)
+        except OSError as e:
+            logging.warning(f"Could not remove worker profile copy. It will be refreshed on the next scraper run. Error: {e}")
+
     # 2. Launch the creation process (logic from create_master_profile.py)
     logging.info(f"Creating new master profile at: {MASTER_PROFILE_PATH}")
     
@@ -60,5 +69,9 @@ if __name__ == "__main__":
         driver.quit()
     except:
         pass
-        
+
+    # Stamp the new profile so the GMB scraper re-copies it for its parallel workers
+    with open(os.path.join(MASTER_PROFILE_PATH, config.PROFILE_GENERATION_FILE), 'w') as f:
+        f.write(str(time.time()))
+
     logging.info("Master profile has been refreshed. You can now run the main.py or ranking_automator.py script.")
\ No newline at end of file